@@ -1,7 +1,12 @@
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
+import numpy as np
 import networkx as nx
 from geopy.distance import geodesic
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(page_title="Delhi Metro Route Finder", layout="wide")
@@ -105,54 +110,209 @@ def calculate_time(dist, stations, changes):
     travel = (dist / BASE_SPEED) * 60
     return int(round(travel + stations * DWELL + changes * INTERCHANGE))
 
+# ---------------- DISTANCE ----------------
+def edge_km(lat1, lon1, lat2, lon2):
+    return np.array([
+        geodesic((a, b), (c, d)).km if pd.notna([a, b, c, d]).all() else np.nan
+        for a, b, c, d in zip(lat1, lon1, lat2, lon2)
+    ])
+
 # ---------------- LOAD DATA ----------------
+BASE_DIR = Path(__file__).parent
+STATIONS_XLSX = BASE_DIR / "stations_master.xlsx"
+STATIONS_PARQUET = BASE_DIR / "stations_master.parquet"
+LINES_CSV = BASE_DIR / "station_line_mapping.csv"
+EDGES_CSV = BASE_DIR / "edges_table.csv"
+MAP_IMAGE = BASE_DIR / "Delhi_metro_map.png"
+
+for data_file in (STATIONS_XLSX, LINES_CSV, EDGES_CSV):
+    if not data_file.exists():
+        st.error(f"Data file not found: {data_file.name}")
+        st.stop()
+
 @st.cache_data
 def load_data():
-    sm = pd.read_excel("stations_master.xlsx")
-    lm = pd.read_csv("station_line_mapping.csv")
-    ed = pd.read_csv("edges_table.csv")
+    if (not STATIONS_PARQUET.exists()
+            or STATIONS_PARQUET.stat().st_mtime < STATIONS_XLSX.stat().st_mtime):
+        pd.read_excel(STATIONS_XLSX).to_parquet(STATIONS_PARQUET)
+    sm = pd.read_parquet(STATIONS_PARQUET)
+    lm = pd.read_csv(
+        LINES_CSV,
+        usecols=lambda c: c.lower().strip() in
+            {"station_name", "line_name", "sequence_order"}
+    )
+    ed = pd.read_csv(
+        EDGES_CSV,
+        usecols=lambda c: c.lower().strip() in
+            {"from_station", "to_station", "line_name", "travel_time_min"}
+    )
 
     for df in [sm, lm, ed]:
         df.columns = df.columns.str.lower().str.strip()
 
+    lm = lm.astype({"station_name": "category", "line_name": "category"})
+    ed = ed.astype({"line_name": "category"})
+
+    # one row per undirected edge, at its first position with the last row's
+    # attributes, which is what repeated nx.Graph.add_edge calls produced
+    pair = np.sort(ed[["from_station", "to_station"]].to_numpy(), axis=1)
+    ed["_a"], ed["_b"] = pair[:, 0], pair[:, 1]
+    ed = (
+        ed.drop_duplicates(["_a", "_b"])[["_a", "_b"]]
+        .merge(ed.drop_duplicates(["_a", "_b"], keep="last"), on=["_a", "_b"], how="left")
+        .drop(columns=["_a", "_b"])
+    )
+    if "travel_time_min" not in ed:
+        ed["travel_time_min"] = np.nan
+
+    # geodesic length of each edge, computed once and summed along routes;
+    # missing travel times are estimated from it at BASE_SPEED
+    coords = sm.drop_duplicates("station_name", keep="last").set_index("station_name")
+    ed["distance_km"] = edge_km(
+        ed["from_station"].map(coords["latitude"]), ed["from_station"].map(coords["longitude"]),
+        ed["to_station"].map(coords["latitude"]), ed["to_station"].map(coords["longitude"])
+    )
+    ed["travel_time_min"] = (
+        pd.to_numeric(ed["travel_time_min"], errors="coerce")
+        .fillna(ed["distance_km"] / BASE_SPEED * 60)
+        .fillna(2.0)
+        .astype("float32")
+    )
+
     lm = lm.merge(
         sm[["station_name", "latitude", "longitude"]],
         on="station_name",
         how="left"
     )
-    return lm, ed
 
-stations, edges = load_data()
+    stations_by_line = (
+        lm.drop_duplicates(["line_name", "station_name"])
+        .set_index(["line_name", "station_name"])["sequence_order"]
+        .sort_index()
+    )
+    line_terminals = (
+        lm.sort_values("sequence_order")
+        .groupby("line_name", observed=True)["station_name"]
+        .agg(["first", "last"])
+        .to_dict("index")
+    )
+    return lm, ed, stations_by_line, line_terminals
+
+stations, edges, stations_by_line, line_terminals = load_data()
 
 # ---------------- DIRECTION + PLATFORM ----------------
 def get_boarding_info(curr, nxt, line):
-    df = stations[stations["line_name"] == line]
-    c = df[df["station_name"] == curr]["sequence_order"].values
-    n = df[df["station_name"] == nxt]["sequence_order"].values
-
-    if len(c) == 0 or len(n) == 0:
+    try:
+        c = stations_by_line.loc[(line, curr)]
+        n = stations_by_line.loc[(line, nxt)]
+    except KeyError:
         return "Towards terminal", "Platform 1"
 
-    start = df.sort_values("sequence_order").iloc[0]["station_name"]
-    end   = df.sort_values("sequence_order").iloc[-1]["station_name"]
+    start = line_terminals[line]["first"]
+    end   = line_terminals[line]["last"]
 
-    if n[0] > c[0]:
+    if n > c:
         return f"Towards {end}", get_platform(line, "forward")
     else:
         return f"Towards {start}", get_platform(line, "reverse")
 
 # ---------------- GRAPH ----------------
-G = nx.Graph()
-for _, r in stations.iterrows():
-    G.add_node(r["station_name"], lat=r["latitude"], lon=r["longitude"])
-
-for _, r in edges.iterrows():
-    G.add_edge(
-        r["from_station"],
-        r["to_station"],
-        weight=float(r.get("travel_time_min", 2)),
-        line=r["line_name"]
+@st.cache_resource
+def build_graph(stations, edges):
+    edge_list = edges.rename(columns={"line_name": "line", "travel_time_min": "weight"})
+
+    G = nx.from_pandas_edgelist(
+        edge_list,
+        source="from_station",
+        target="to_station",
+        edge_attr=["weight", "line", "distance_km"],
+        create_using=nx.Graph
+    )
+
+    coords = (
+        stations.drop_duplicates("station_name")
+        .set_index("station_name")[["latitude", "longitude"]]
+        .rename(columns={"latitude": "lat", "longitude": "lon"})
     )
+    G.add_nodes_from(coords.to_dict("index").items())
+    return G, tuple(sorted(G.nodes))
+
+G, STATIONS = build_graph(stations, edges)
+
+# ---------------- ROUTE SEARCH ----------------
+# The fewest-change alternative is searched on a line-expanded graph: one node
+# per (station, line) plus a hub node per station. Changing lines passes
+# through the hub at a tiny cost, so among equally fast routes the one with
+# fewest interchanges wins.
+TRANSFER_EPSILON = 1e-3
+
+@st.cache_resource
+def build_routes(_G):
+    nodes = list(_G.nodes)
+    hub = {n: i for i, n in enumerate(nodes)}
+    line_node = {}
+    src, dst, w = [], [], []
+
+    def node_for(station, line):
+        if (station, line) not in line_node:
+            line_node[(station, line)] = len(nodes)
+            nodes.append(station)
+            src.append(hub[station])
+            dst.append(line_node[(station, line)])
+            w.append(TRANSFER_EPSILON / 2)
+        return line_node[(station, line)]
+
+    for a, b, d in _G.edges(data=True):
+        u, v = node_for(a, d["line"]), node_for(b, d["line"])
+        src.append(u)
+        dst.append(v)
+        w.append(d["weight"])
+
+    adj = csr_matrix((w, (src, dst)), shape=(len(nodes), len(nodes)))
+    _, pred = dijkstra(adj, directed=False, indices=range(len(hub)), return_predecessors=True)
+    return nodes, hub, pred
+
+route_nodes, node_idx, route_pred = build_routes(G)
+
+def fewest_change_path(source, target):
+    s, j = node_idx[source], node_idx[target]
+    path = [target]
+    while j != s:
+        j = route_pred[s, j]
+        if j < 0:
+            raise nx.NetworkXNoPath(f"No route between {source} and {target}")
+        if route_nodes[j] != path[-1]:
+            path.append(route_nodes[j])
+    return path[::-1]
+
+def route_stats(path):
+    distance = sum(G[path[i]][path[i+1]]["distance_km"] for i in range(len(path)-1))
+
+    lines = np.array([G[path[i]][path[i+1]]["line"] for i in range(len(path)-1)])
+    changes = int((lines[1:] != lines[:-1]).sum())
+
+    return path, lines, distance, changes
+
+@st.cache_data
+def compute_route(source, target):
+    path = nx.shortest_path(G, source, target, weight="weight")
+    route = route_stats(path)
+
+    # only switch to an equally fast route that saves an interchange
+    # without showing a longer journey time or a higher fare
+    alt_path = fewest_change_path(source, target)
+    if alt_path != path:
+        alt = route_stats(alt_path)
+        if (
+            alt[3] < route[3]
+            and nx.path_weight(G, alt_path, "weight") <= nx.path_weight(G, path, "weight")
+            and calculate_time(alt[2], len(alt_path), alt[3])
+                <= calculate_time(route[2], len(path), route[3])
+            and dmrc_fare(alt[2]) <= dmrc_fare(route[2])
+        ):
+            route = alt
+
+    return route
 
 # ---------------- HEADER + MAP ----------------
 if "show_map" not in st.session_state:
@@ -167,35 +327,25 @@ with h2:
         st.session_state.show_map = not st.session_state.show_map
 
 if st.session_state.show_map:
-    st.image("Delhi_metro_map.png", use_container_width=True)
+    st.image(str(MAP_IMAGE), use_container_width=True)
     st.markdown("---")
 
 # ---------------- INPUTS ----------------
-source = st.selectbox("🚉 Source Station", sorted(G.nodes), index=None, placeholder="Search station...")
-target = st.selectbox("🎯 Destination Station", sorted(G.nodes), index=None, placeholder="Search station...")
+source = st.selectbox("🚉 Source Station", STATIONS, index=None, placeholder="Search station...")
+target = st.selectbox("🎯 Destination Station", STATIONS, index=None, placeholder="Search station...")
 
 # ---------------- ROUTE ----------------
 if st.button("🚆 Get Route") and source and target:
-    path = nx.shortest_path(G, source, target, weight="weight")
-
-    distance = sum(
-        geodesic(
-            (G.nodes[path[i]]["lat"], G.nodes[path[i]]["lon"]),
-            (G.nodes[path[i+1]]["lat"], G.nodes[path[i+1]]["lon"])
-        ).km
-        for i in range(len(path)-1)
-    )
+    key = (source, target)
+    if st.session_state.get("route_key") != key:
+        path, lines, distance, changes = compute_route(source, target)
+        fare = dmrc_fare(distance)
+        time = calculate_time(distance, len(path), changes)
+        st.session_state.route_key = key
+        st.session_state.route_val = (path, lines, distance, changes, fare, time)
 
-    prev = None
-    changes = 0
-    for i in range(len(path)-1):
-        l = G[path[i]][path[i+1]]["line"]
-        if prev and prev != l:
-            changes += 1
-        prev = l
-
-    fare = dmrc_fare(distance)
-    time = calculate_time(distance, len(path), changes)
+if source and target and st.session_state.get("route_key") == (source, target):
+    path, lines, distance, changes, fare, time = st.session_state.route_val
 
     # ---------------- SUMMARY ----------------
     st.markdown(f"""
@@ -214,7 +364,7 @@ if st.button("🚆 Get Route") and source and target:
     # ---------------- DETAILS ----------------
     st.markdown("## 🧭 Route Details")
 
-    first_line = G[path[0]][path[1]]["line"]
+    first_line = lines[0]
     direction, platform = get_boarding_info(path[0], path[1], first_line)
 
     st.markdown(
@@ -229,33 +379,32 @@ if st.button("🚆 Get Route") and source and target:
     )
 
     prev_line = first_line
+    html_parts = []
 
     for i, s in enumerate(path, start=1):
         line = None
         if i < len(path):
-            line = G[path[i-1]][path[i]]["line"]
+            line = lines[i-1]
 
-        st.markdown(
-            f"<div class='route-box' style='--line-color:{line_color(line)}'><b>{i}. {s}</b></div>",
-            unsafe_allow_html=True
+        html_parts.append(
+            f"<div class='route-box' style='--line-color:{line_color(line)}'><b>{i}. {s}</b></div>"
         )
 
         if prev_line and line and prev_line != line:
             direction, platform = get_boarding_info(path[i-1], path[i], line)
-            st.markdown(
-                f"""
-                <div class='junction-box'>
-                🔁 <b>Junction</b><br>
-                Change from {line_name(prev_line)} to {line_name(line)}<br>
-                ➡ {direction}<br>
-                🚉 {platform}
-                </div>
-                """,
-                unsafe_allow_html=True
+            html_parts.append(
+                "<div class='junction-box'>"
+                "🔁 <b>Junction</b><br>"
+                f"Change from {line_name(prev_line)} to {line_name(line)}<br>"
+                f"➡ {direction}<br>"
+                f"🚉 {platform}"
+                "</div>"
             )
 
         prev_line = line
 
+    st.markdown("".join(html_parts), unsafe_allow_html=True)
+
 # ---------------- FOOTER ----------------
 st.markdown("""
 <div class="footer">